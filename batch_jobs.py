@@ -0,0 +1,567 @@
+# batch_jobs.py
+# 不依赖 Streamlit 的批量任务接口：单码/双码合成和拼版都可以在脚本或命令行里调用
+# 命令行任务按分块写出多个输出文件，并记录检查点清单 (manifest.json)，中断后重新执行同一命令即可从断点继续
+#   python batch_jobs.py single --template tpl.pdf --rect 45 140 85 85 --source qrs.zip --out out/
+#   python batch_jobs.py dual --template tpl.pdf --left 110 140 210 210 --right 463 140 210 210 --source payloads.csv --out out/
+#   python batch_jobs.py impose --source pdfs/ --grid 8 5 --gap 20 --out out/
+import argparse
+import collections
+import hashlib
+import json
+import math
+import os
+import re
+import zipfile
+
+import fitz  # PyMuPDF
+
+from output_cache import CACHE_DIR, DEFAULT_MAX_BYTES, OutputCache, cache_key, digest
+from parallel import composite_items, default_workers, encode_items, impose_sheets
+from pdf_engine import (COLOR_MODES, FusedImposer, MultiPageCompositor, collect_imposition_cells, impose_all,
+                        mm_to_points, split_sheets)
+from vector_qr import DEFAULT_BORDER, QR_ERROR_LEVELS, read_payload_rows
+from zip_output import SpooledZip
+
+# 每个输出分块包含的条目数 (单码/双码为二维码数量；拼版为源页面数，并向上取整到整版)
+DEFAULT_JOB_CHUNK = 5000
+MANIFEST_NAME = "manifest.json"
+
+OUTPUT_MODE_CHOICES = ("zip", "multipage", "imposed_zip", "imposed_multipage")
+IMPOSITION_MODE_CHOICES = ("zip", "multipage")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+PAYLOAD_EXTENSIONS = (".csv", ".txt")
+
+
+def output_suffix(output_mode):
+    # 合并成一个PDF的模式输出 .pdf，其余输出 .zip
+    return ".pdf" if output_mode in ("multipage", "imposed_multipage") else ".zip"
+
+
+# ===================================================================
+# 输出写入：结果直接写到指定路径，Streamlit 界面和命令行共用
+# ===================================================================
+def _item_key(base_key, images):
+    # 二维码内容 (矢量模式) 是文本，图片是字节
+    return cache_key(base_key, [digest(data.encode("utf-8") if isinstance(data, str) else data) for data in images])
+
+
+def write_generated(path, template_data, rects, items, output_mode="zip", compression=zipfile.ZIP_STORED,
+                    imposition=None, image_options=None, workers=1, progress=None, cache=None):
+    # items: 可迭代的 (输出文件名, [各位置的图片字节或二维码内容])；imposition: 直接拼版模式下的 (列, 行, 间距mm)
+    # image_options 见 pdf_engine.make_encoder；progress: 可选回调，每处理完一项 (无论成败) 调用一次
+    # cache: 可选的 OutputCache，只用于每项一个PDF的 ZIP 输出 (合并成一个文件的模式无法逐项复用)
+    # 返回 (成功数量, 日志)
+    logs = []
+    done = 0
+
+    def encoded_items():
+        # 图片在工作进程里编码，主进程按顺序写入；出错的条目记入日志后跳过
+        nonlocal done
+        for fname, encoded, error in encode_items(items, rects, image_options, workers=workers):
+            if progress:
+                progress(1)
+            if error:
+                logs.append(f"  -> ⚠️ 警告: 生成 '{fname}' 时出错: {error}")
+            else:
+                done += 1
+                yield os.path.splitext(fname)[0], encoded
+
+    if output_mode == "multipage":
+        with MultiPageCompositor(template_data, rects) as writer:
+            for label, encoded in encoded_items():
+                # 每页以原本的文件名作为书签
+                writer.add_encoded_page(encoded, label=label)
+            if done:
+                writer.save(path)
+        return done, logs
+
+    if output_mode in ("imposed_zip", "imposed_multipage"):
+        cols, rows, gap_mm = imposition
+        with FusedImposer(template_data, rects, cols, rows, mm_to_points(gap_mm)) as imposer:
+            sheet_inputs = (encoded for _, encoded in encoded_items())
+            if output_mode == "imposed_multipage":
+                imposer.write_all(sheet_inputs, path)
+                return done, logs
+            with SpooledZip(compression, path=path) as output_zip:
+                for i, pdf_bytes in enumerate(imposer.iter_sheets(sheet_inputs)):
+                    output_zip.writestr(f"layout_{cols}x{rows}_batch_{i+1}.pdf", pdf_bytes)
+            return done, logs
+
+    # 缓存键由模板、位置、图片处理参数和本项的图片内容决定，与输出文件名无关
+    base_key = cache_key("generated", digest(template_data), [list(map(float, r)) for r in rects], image_options)
+    # 与送进 composite_items 的条目一一对应的 (缓存键, 图片)：命中缓存的条目不合成，只在结果流里占位，
+    # 轮到它时再从磁盘读取，图片只在缓存中途被淘汰时用来重新合成；未命中的图片为 None
+    # 命中的条目和未命中的一样占用进程池的挂起窗口，所以队列长度不会超过这个窗口
+    queue = collections.deque()
+    hits = 0
+
+    def lookup_items():
+        for fname, images in items:
+            key = _item_key(base_key, images) if cache else None
+            if cache and cache.touch(key):
+                queue.append((key, images))
+                yield fname, None
+            else:
+                queue.append((key, None))
+                yield fname, images
+
+    with SpooledZip(compression, path=path) as output_zip:
+        for fname, pdf_bytes, error in composite_items(template_data, rects, lookup_items(), image_options, workers=workers):
+            # composite_items 按输入顺序返回，队首就是这一项
+            key, cached_images = queue.popleft()
+            rendered = cached_images is None
+            if not rendered:
+                pdf_bytes = cache.get(key)
+                if pdf_bytes is None:
+                    # 排队期间被淘汰 (极少见)，在本进程里重新合成
+                    _, pdf_bytes, error = next(composite_items(template_data, rects, [(fname, cached_images)], image_options))
+                    rendered = True
+                else:
+                    hits += 1
+            if progress:
+                progress(1)
+            if error:
+                logs.append(f"  -> ⚠️ 警告: 生成 '{fname}' 时出错: {error}")
+                continue
+            output_zip.writestr(fname, pdf_bytes)
+            done += 1
+            if cache and rendered:
+                cache.put(key, pdf_bytes)
+    if hits:
+        logs.append(f"♻️ 有 {hits} 个条目与之前生成过的相同，已直接从缓存复用。")
+    return done, logs
+
+
+def write_imposition(path, cells, sources, cols, rows, gap_pt, output_mode="zip", compression=zipfile.ZIP_STORED,
+                     dedupe_resources=True, workers=1, progress=None, cache=None):
+    # cells/sources 见 pdf_engine.collect_imposition_cells；progress: 可选回调，每完成一张拼版调用一次
+    # cache: 可选的 OutputCache，只用于每批一个PDF的 ZIP 输出
+    # 返回 (成功拼版的单元格数, 日志)
+    batch_size = cols * rows
+    if output_mode == "multipage":
+        sheets = list(split_sheets(cells, sources, batch_size))
+        if not sheets:
+            return 0, []
+        return len(cells), impose_all(sheets, cols, rows, gap_pt, path, dedupe_resources, progress)
+
+    logs = []
+    done = 0
+    num_batches = math.ceil(len(cells) / batch_size)
+    # 拼版内容只取决于各单元格的源文件内容和页码 (文件名只出现在日志里)
+    base_key = cache_key("imposition", cols, rows, gap_pt, dedupe_resources)
+    # 与送进 impose_sheets 的项一一对应的 (缓存键, sheet)：命中缓存的拼版不重新拼，只在结果流里占位，
+    # sheet 只在缓存中途被淘汰时用来重新拼版；未命中的为 None。队列长度不超过进程池的挂起窗口
+    queue = collections.deque()
+
+    def lookup_sheets():
+        for sheet in split_sheets(cells, sources, batch_size):
+            key = cache_key(base_key, [[key, pno] for _, key, pno in sheet[0]]) if cache else None
+            if cache and cache.touch(key):
+                queue.append((key, sheet))
+                yield None
+            else:
+                queue.append((key, None))
+                yield sheet
+
+    with SpooledZip(compression, path=path) as zip_archive:
+        results = impose_sheets(lookup_sheets(), cols, rows, gap_pt, dedupe_resources, workers=workers)
+        for i, (pdf_bytes, batch_logs) in enumerate(results):
+            key, cached_sheet = queue.popleft()
+            # 只有最后一张可能排不满
+            sheet_cells = min(batch_size, len(cells) - i * batch_size)
+            if progress:
+                progress(1)
+            output_filename = f"layout_{cols}x{rows}_batch_{i+1}.pdf"
+            if cached_sheet is not None:
+                pdf_bytes = cache.get(key)
+                if pdf_bytes is not None:
+                    zip_archive.writestr(output_filename, pdf_bytes)
+                    done += sheet_cells
+                    logs.append(f"\n📄 第 {i+1}/{num_batches} 批与之前的拼版相同，已从缓存复用 -> {output_filename}")
+                    continue
+                # 排队期间被淘汰 (极少见)，在本进程里重新拼版
+                pdf_bytes, batch_logs = next(impose_sheets([cached_sheet], cols, rows, gap_pt, dedupe_resources))
+
+            logs.append(f"\n📄 正在处理第 {i+1}/{num_batches} 批...")
+            logs.extend(batch_logs)
+            if pdf_bytes is None:
+                continue
+            zip_archive.writestr(output_filename, pdf_bytes)
+            done += sheet_cells
+            logs.append(f"  -> ✅ 第 {i+1} 批拼版完成 -> {output_filename}")
+            if cache:
+                cache.put(key, pdf_bytes)
+    return done, logs
+
+
+# ===================================================================
+# 输入：目录或 ZIP 包，按文件名排序，数据在真正用到时才读取
+# ===================================================================
+class InputSource:
+    def __init__(self, path, extensions):
+        # path: 目录、ZIP 文件路径，或已打开的 ZIP 文件对象 (如网页上传的文件)
+        self.path = path
+        self._zip = None
+        if isinstance(path, str) and os.path.isdir(path):
+            self.names = sorted(f for f in os.listdir(path)
+                                if f.lower().endswith(extensions) and os.path.isfile(os.path.join(path, f)))
+        else:
+            self._zip = zipfile.ZipFile(path)
+            self.names = sorted(f for f in self._zip.namelist()
+                                if f.lower().endswith(extensions) and not f.startswith("__MACOSX"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+    def read(self, name):
+        if self._zip is not None:
+            return self._zip.read(name)
+        with open(os.path.join(self.path, name), "rb") as f:
+            return f.read()
+
+
+def _stem(name):
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+def _natural_key(text):
+    # 文件名里的数字按数值排序：q2 排在 q10 前面
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", text)]
+
+
+def pair_by_stem(left_names, right_names):
+    # 按文件名 (不含目录和扩展名) 建立排序索引后配对，结果与上传/打包顺序无关
+    # 两侧有同名文件时按同名配对，否则按排序后的顺序一一配对；返回 ([(左, 右)], 日志)
+    left = {}
+    for name in sorted(left_names, key=_natural_key):
+        left.setdefault(_stem(name), name)
+    right = {}
+    for name in sorted(right_names, key=_natural_key):
+        right.setdefault(_stem(name), name)
+    logs = []
+    common = sorted(left.keys() & right.keys(), key=_natural_key)
+    if common:
+        pairs = [(left[stem], right[stem]) for stem in common]
+        unmatched = len(left) + len(right) - 2 * len(common)
+        if unmatched:
+            logs.append(f"ℹ️ 提示：有 {unmatched} 个二维码在另一侧找不到同名文件，已跳过。")
+    else:
+        pairs = list(zip((left[stem] for stem in sorted(left, key=_natural_key)),
+                         (right[stem] for stem in sorted(right, key=_natural_key))))
+        if len(left) != len(right):
+            logs.append(f"ℹ️ 提示：左右二维码数量不同，将按数量较少的一方（{len(pairs)}对）进行处理。")
+    duplicates = len(left_names) + len(right_names) - len(left) - len(right)
+    if duplicates:
+        logs.append(f"ℹ️ 提示：有 {duplicates} 个二维码与同侧其他文件重名 (仅扩展名或目录不同)，已跳过。")
+    return pairs, logs
+
+
+def _is_payload_file(path):
+    return os.path.isfile(path) and path.lower().endswith(PAYLOAD_EXTENSIONS)
+
+
+def _read_payloads(path, slots, log):
+    with open(path, "rb") as f:
+        data = f.read()
+    rows = []
+    for name, payloads, error in read_payload_rows(data, os.path.basename(path), slots):
+        if error:
+            log(f"  -> ⚠️ 警告: 跳过 '{name}': {error}")
+        else:
+            rows.append((f"{name}.pdf", payloads))
+    return rows
+
+
+# ===================================================================
+# 检查点：每写完一个分块就更新 manifest.json，重新执行时跳过已完成的分块
+# ===================================================================
+def _fingerprint(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def _load_manifest(output_dir, params):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["params"] != params:
+            raise ValueError(f"输出目录 {output_dir} 里已有参数或输入不同的任务，请换一个输出目录")
+        return manifest
+    return {"params": params, "parts": []}
+
+
+def _save_manifest(output_dir, manifest):
+    # 先写临时文件再替换，中途被杀掉也不会留下半个清单
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def run_chunked(output_dir, params, entries, chunk_size, suffix, write_part, log=print):
+    # entries: 全部输入条目 (只是名称等轻量信息)；write_part(路径, 本块条目) 写出一个分块，返回 (成功数量, 日志)
+    # 返回最终的清单字典
+    os.makedirs(output_dir, exist_ok=True)
+    params = dict(params, chunk_size=chunk_size, count=len(entries))
+    manifest = _load_manifest(output_dir, params)
+    if not entries:
+        log("⚠️ 没有找到可处理的输入，未生成任何分块")
+        _save_manifest(output_dir, manifest)
+        return manifest
+    num_parts = math.ceil(len(entries) / chunk_size)
+    if manifest["parts"]:
+        log(f"从检查点继续：已完成 {len(manifest['parts'])}/{num_parts} 个分块")
+    for index in range(len(manifest["parts"]), num_parts):
+        chunk = entries[index * chunk_size:(index + 1) * chunk_size]
+        file_name = f"part_{index + 1:05d}{suffix}"
+        part_path = os.path.join(output_dir, file_name)
+        tmp_path = part_path + ".partial"
+        done, logs = write_part(tmp_path, chunk)
+        for line in logs:
+            log(line)
+        if os.path.exists(tmp_path):
+            os.replace(tmp_path, part_path)
+        else:
+            # 整块都失败时多页模式不会生成文件
+            file_name = None
+        manifest["parts"].append({"file": file_name, "items": len(chunk), "done": done})
+        _save_manifest(output_dir, manifest)
+        log(f"分块 {index + 1}/{num_parts} 完成：{done}/{len(chunk)} -> {file_name}")
+    return manifest
+
+
+# ===================================================================
+# 公开接口
+# ===================================================================
+def _generation_params(operation, template_data, rects, output_mode, imposition, image_options, compression):
+    return {
+        "operation": operation,
+        "template": _fingerprint(template_data),
+        "rects": [list(map(float, r)) for r in rects],
+        "output_mode": output_mode,
+        "imposition": list(imposition) if imposition else None,
+        "image_options": image_options,
+        "compression": compression,
+    }
+
+
+def _whole_sheets(chunk_size, per_sheet):
+    # 分块大小取整到整张拼版，除最后一块外不会出现未排满的拼版
+    return math.ceil(chunk_size / per_sheet) * per_sheet
+
+
+def _generation_chunk_size(chunk_size, output_mode, imposition, template_data):
+    if output_mode in ("imposed_zip", "imposed_multipage"):
+        # 每个条目占用与模板页数相同的单元格，条目数取整到刚好排满整张拼版的倍数
+        per_sheet = imposition[0] * imposition[1]
+        with fitz.open(stream=template_data, filetype="pdf") as template:
+            pages_per_item = template.page_count
+        return _whole_sheets(chunk_size, per_sheet // math.gcd(per_sheet, pages_per_item))
+    return chunk_size
+
+
+def _run_generation(operation, template_path, rects, entries, read_item, output_dir, output_mode, imposition,
+                    image_options, compression, workers, chunk_size, log, cache):
+    with open(template_path, "rb") as f:
+        template_data = f.read()
+    params = _generation_params(operation, template_data, rects, output_mode, imposition, image_options, compression)
+    # 输入清单变了 (增删文件、改了内容清单) 就不能沿用旧的检查点
+    params["inputs"] = _fingerprint(json.dumps(entries, ensure_ascii=False).encode("utf-8"))
+
+    def write_part(path, chunk):
+        items = (read_item(entry) for entry in chunk)
+        return write_generated(path, template_data, rects, items, output_mode, compression, imposition,
+                               image_options, workers, cache=cache)
+
+    return run_chunked(output_dir, params, entries, _generation_chunk_size(chunk_size, output_mode, imposition, template_data),
+                       output_suffix(output_mode), write_part, log)
+
+
+def run_single(template_path, rect, source, output_dir, output_mode="zip", imposition=None, image_options=None,
+               compression=zipfile.ZIP_STORED, workers=1, chunk_size=DEFAULT_JOB_CHUNK, log=print, cache=None):
+    # rect: 二维码位置 (x0, y0, x1, y1)；source: 二维码图片目录/ZIP，或 CSV/TXT 内容清单 (矢量绘制)
+    # imposition: 直接拼版模式下的 (列, 行, 间距mm)；cache: 可选的 OutputCache；返回检查点清单
+    rects = [tuple(rect)]
+    if _is_payload_file(source):
+        entries = _read_payloads(source, 1, log)
+        image_options = dict(image_options or {}, vector=True)
+        return _run_generation("single", template_path, rects, entries, lambda entry: entry, output_dir,
+                               output_mode, imposition, image_options, compression, workers, chunk_size, log, cache)
+    with InputSource(source, IMAGE_EXTENSIONS) as images:
+        entries = [(f"{_stem(name)}.pdf", name) for name in images.names]
+        return _run_generation("single", template_path, rects, entries,
+                               lambda entry: (entry[0], [images.read(entry[1])]), output_dir,
+                               output_mode, imposition, image_options, compression, workers, chunk_size, log, cache)
+
+
+def run_dual(template_path, left_rect, right_rect, source, output_dir, right_source=None, output_mode="zip",
+             imposition=None, image_options=None, compression=zipfile.ZIP_STORED, workers=1,
+             chunk_size=DEFAULT_JOB_CHUNK, log=print, cache=None):
+    # source: 两列内容的 CSV/TXT 清单，或左侧二维码图片目录/ZIP (此时 right_source 为右侧的)
+    # 图片的配对规则见 pair_by_stem
+    rects = [tuple(left_rect), tuple(right_rect)]
+    if _is_payload_file(source):
+        entries = _read_payloads(source, 2, log)
+        image_options = dict(image_options or {}, vector=True)
+        return _run_generation("dual", template_path, rects, entries, lambda entry: entry, output_dir,
+                               output_mode, imposition, image_options, compression, workers, chunk_size, log, cache)
+    if right_source is None:
+        raise ValueError("使用图片输入时需要同时提供左右两侧的二维码")
+    with InputSource(source, IMAGE_EXTENSIONS) as left, InputSource(right_source, IMAGE_EXTENSIONS) as right:
+        pairs, pair_logs = pair_by_stem(left.names, right.names)
+        for line in pair_logs:
+            log(line)
+        entries = [(f"{_stem(l)}+{_stem(r)}.pdf", (l, r)) for l, r in pairs]
+        return _run_generation("dual", template_path, rects, entries,
+                               lambda entry: (entry[0], [left.read(entry[1][0]), right.read(entry[1][1])]),
+                               output_dir, output_mode, imposition, image_options, compression, workers,
+                               chunk_size, log, cache)
+
+
+def _imposition_entries(pdfs, log):
+    # 先把源文件逐个读一遍 (只取页数，不保留内容)，每个源页面一个条目 (显示名, 文件名, 页码)
+    # 读不了的文件在这里就记入日志并跳过，不占单元格
+    entries = []
+    for name in pdfs.names:
+        cells, _, logs = collect_imposition_cells([(name, pdfs.read(name))])
+        for line in logs:
+            log(line)
+        entries.extend((label, name, pno) for label, _, pno in cells)
+    return entries
+
+
+def run_imposition(source, output_dir, cols, rows, gap_mm, output_mode="zip", dedupe_resources=True,
+                   compression=zipfile.ZIP_STORED, workers=1, chunk_size=DEFAULT_JOB_CHUNK, log=print, cache=None):
+    # source: 源PDF目录或ZIP；每个分块包含 chunk_size 个源页面 (取整到整张拼版)，分块内按内容去重
+    gap_pt = mm_to_points(gap_mm)
+    with InputSource(source, (".pdf",)) as pdfs:
+        entries = _imposition_entries(pdfs, log)
+        params = {
+            "operation": "impose",
+            "grid": [cols, rows, gap_mm],
+            "output_mode": output_mode,
+            "dedupe_resources": dedupe_resources,
+            "compression": compression,
+            "inputs": _fingerprint(json.dumps(entries, ensure_ascii=False).encode("utf-8")),
+        }
+
+        def write_part(path, chunk):
+            # 本块用到的源文件各读一次
+            cells, sources, keys = [], {}, {}
+            for label, name, pno in chunk:
+                if name not in keys:
+                    data = pdfs.read(name)
+                    keys[name] = _fingerprint(data)
+                    sources[keys[name]] = data
+                cells.append((label, keys[name], pno))
+            return write_imposition(path, cells, sources, cols, rows, gap_pt, output_mode, compression,
+                                    dedupe_resources, workers, cache=cache)
+
+        return run_chunked(output_dir, params, entries, _whole_sheets(chunk_size, cols * rows),
+                           output_suffix(output_mode), write_part, log)
+
+
+# ===================================================================
+# 命令行入口
+# ===================================================================
+def _add_common_args(parser, modes):
+    parser.add_argument("--out", required=True, help="输出目录 (同时存放检查点清单)")
+    parser.add_argument("--mode", choices=modes, default="zip", help="输出方式")
+    parser.add_argument("--compress", action="store_true", help="ZIP 使用 ZIP_DEFLATED 压缩")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="并行进程数")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_JOB_CHUNK, help="每个输出分块的条目数")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="输出缓存目录，未变化的条目直接复用")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help="输出缓存容量上限 (MB)")
+    parser.add_argument("--no-cache", action="store_true", help="不使用输出缓存")
+
+
+def _add_generation_args(parser):
+    parser.add_argument("--template", required=True, help="PDF模板")
+    parser.add_argument("--grid", type=int, nargs=2, metavar=("COLS", "ROWS"), default=(8, 5), help="直接拼版的网格")
+    parser.add_argument("--gap", type=float, default=20.0, help="直接拼版的间距 (mm)")
+    parser.add_argument("--dpi", type=int, default=0, help="图片目标打印分辨率，0 为保持原图")
+    parser.add_argument("--color", choices=COLOR_MODES, default="color", help="图片颜色处理")
+    parser.add_argument("--qr-error", choices=QR_ERROR_LEVELS, default="M", help="矢量二维码纠错等级")
+    parser.add_argument("--qr-border", type=int, default=DEFAULT_BORDER, help="矢量二维码静区宽度 (模块数)")
+    _add_common_args(parser, OUTPUT_MODE_CHOICES)
+
+
+def _xywh(values):
+    x, y, w, h = values
+    return (x, y, x + w, y + h)
+
+
+def _generation_kwargs(args):
+    if _is_payload_file(args.source):
+        image_options = {"error": args.qr_error, "border": args.qr_border}
+    else:
+        image_options = {"target_dpi": args.dpi or None, "color_mode": args.color}
+    return {
+        "output_mode": args.mode,
+        "imposition": (args.grid[0], args.grid[1], args.gap) if args.mode.startswith("imposed") else None,
+        "image_options": image_options,
+        "compression": zipfile.ZIP_DEFLATED if args.compress else zipfile.ZIP_STORED,
+        "workers": args.workers,
+        "chunk_size": args.chunk_size,
+        "cache": _output_cache(args),
+    }
+
+
+def _output_cache(args):
+    if args.no_cache:
+        return None
+    return OutputCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PDF 工具箱批量任务 (可断点续跑)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    single = commands.add_parser("single", help="单二维码批量合成")
+    single.add_argument("--rect", type=float, nargs=4, metavar=("X", "Y", "W", "H"), required=True, help="二维码位置和尺寸")
+    single.add_argument("--source", required=True, help="二维码图片目录/ZIP，或 CSV/TXT 内容清单")
+    _add_generation_args(single)
+
+    dual = commands.add_parser("dual", help="双二维码批量合成")
+    dual.add_argument("--left", type=float, nargs=4, metavar=("X", "Y", "W", "H"), required=True, help="左侧二维码位置和尺寸")
+    dual.add_argument("--right", type=float, nargs=4, metavar=("X", "Y", "W", "H"), required=True, help="右侧二维码位置和尺寸")
+    dual.add_argument("--source", required=True, help="两列内容的 CSV/TXT 清单，或左侧二维码图片目录/ZIP")
+    dual.add_argument("--right-source", help="右侧二维码图片目录/ZIP (图片输入时必填)")
+    _add_generation_args(dual)
+
+    impose = commands.add_parser("impose", help="PDF 拼版")
+    impose.add_argument("--source", required=True, help="源PDF目录或ZIP")
+    impose.add_argument("--grid", type=int, nargs=2, metavar=("COLS", "ROWS"), default=(8, 5), help="网格")
+    impose.add_argument("--gap", type=float, default=20.0, help="间距 (mm)")
+    impose.add_argument("--no-dedupe", action="store_true", help="不合并不同文件间的重复资源")
+    _add_common_args(impose, IMPOSITION_MODE_CHOICES)
+
+    args = parser.parse_args(argv)
+    for path in (getattr(args, "template", None), args.source, getattr(args, "right_source", None)):
+        if path and not os.path.exists(path):
+            parser.error(f"找不到文件或目录: {path}")
+    # 输入格式不对、输出目录里是别的任务等问题只给出提示，不打印调用栈
+    try:
+        if args.command == "single":
+            run_single(args.template, _xywh(args.rect), args.source, args.out, **_generation_kwargs(args))
+        elif args.command == "dual":
+            run_dual(args.template, _xywh(args.left), _xywh(args.right), args.source, args.out,
+                     right_source=args.right_source, **_generation_kwargs(args))
+        else:
+            run_imposition(args.source, args.out, args.grid[0], args.grid[1], args.gap, args.mode,
+                           not args.no_dedupe, zipfile.ZIP_DEFLATED if args.compress else zipfile.ZIP_STORED,
+                           args.workers, args.chunk_size, cache=_output_cache(args))
+    except (ValueError, OSError, zipfile.BadZipFile) as e:
+        parser.exit(1, f"错误: {e}\n")
+
+
+if __name__ == "__main__":
+    main()
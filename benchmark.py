@@ -0,0 +1,336 @@
+# benchmark.py
+# 性能基准：生成合成模板和二维码，按不同规模测量各工具核心逻辑的吞吐量、峰值内存和输出大小
+# 结果可以保存为基线 JSON，之后离线对比，判断改动是否让性能变差
+#   python benchmark.py --scales 100 1000 --save benchmark_baseline.json
+#   python benchmark.py --scales 100 1000 --compare benchmark_baseline.json
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+import segno
+from PIL import Image
+
+from batch_jobs import write_generated, write_imposition
+from pdf_engine import TemplateCompositor, collect_imposition_cells, mm_to_points
+from preview import PagePreview, QrPreviewImage, composite_preview
+
+# 模板：A4/A3 横向 × 简单 (少量文字和线条) / 复杂 (嵌入多种字体 + 整页背景图)
+TEMPLATES = ("a4_simple", "a4_heavy", "a3_simple", "a3_heavy")
+TOOLS = ("single", "dual", "imposition", "placer")
+DEFAULT_SCALES = (100, 1000)
+# 与工具界面默认值一致的二维码位置
+SINGLE_RECT = (45, 140, 130, 225)
+DUAL_RECTS = [(110, 140, 320, 350), (463, 140, 673, 350)]
+IMPOSITION_GRID = (8, 5, 20.0)
+# 与基线相比，吞吐量下降或峰值内存/输出体积增加超过这个比例视为退化
+REGRESSION_THRESHOLD = 0.10
+# 采样工作进程峰值内存的间隔 (秒)
+MEMORY_SAMPLE_INTERVAL = 0.1
+DATA_DIR = os.path.join(tempfile.gettempdir(), "pdf_toolbox_bench")
+
+
+# ===================================================================
+# 合成测试数据 (固定随机种子，每次生成的内容相同)
+# ===================================================================
+def make_template(name):
+    page_size, kind = name.split("_")
+    width, height = fitz.paper_size(f"{page_size}-l")
+    rng = random.Random(name)
+    doc = fitz.open()
+    page = doc.new_page(width=width, height=height)
+    if kind == "heavy":
+        # 整页背景图：低分辨率噪点放大成斑驳的底纹，JPEG 压缩后约一两百 KB
+        noise = Image.effect_noise((int(width // 4), int(height // 4)), 64).convert("RGB")
+        noise = noise.resize((int(width * 1.5), int(height * 1.5)), Image.BICUBIC)
+        buf = io.BytesIO()
+        noise.save(buf, "JPEG", quality=80)
+        page.insert_image(page.rect, stream=buf.getvalue())
+        # 嵌入几种字体写满说明文字
+        fonts = []
+        for i, base in enumerate(("helv", "tiro", "cour")):
+            fontname = f"F{i}"
+            page.insert_font(fontname=fontname, fontbuffer=fitz.Font(base).buffer)
+            fonts.append(fontname)
+        for line in range(int(height // 12) - 4):
+            words = " ".join(f"item{rng.randrange(100000)}" for _ in range(12))
+            page.insert_text((20, 30 + line * 12), words, fontname=rng.choice(fonts), fontsize=9)
+    page.draw_rect(page.rect + (10, 10, -10, -10), color=(0, 0, 0), width=2)
+    page.insert_text((20, 40), f"PDF toolbox benchmark template {name}", fontsize=18)
+    for _ in range(20):
+        x, y = rng.uniform(0, width), rng.uniform(0, height)
+        page.draw_line((x, y), (x + rng.uniform(-200, 200), y), color=(0.5, 0.5, 0.5))
+    data = doc.tobytes(deflate=True)
+    doc.close()
+    return data
+
+
+def make_qr_image(index):
+    buf = io.BytesIO()
+    segno.make_qr(f"https://example.com/benchmark/{index:06d}").save(buf, kind="png", scale=10, border=4)
+    return buf.getvalue()
+
+
+def _qr_path(data_dir, index):
+    return os.path.join(data_dir, "qrs", f"qr_{index:06d}.png")
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def prepare_data(data_dir, templates, tools, count):
+    # 生成模板、count 张二维码，以及拼版用的 count 个源PDF；已存在的文件直接复用
+    os.makedirs(os.path.join(data_dir, "qrs"), exist_ok=True)
+    for index in range(count):
+        path = _qr_path(data_dir, index)
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(make_qr_image(index))
+    for name in templates:
+        template_path = os.path.join(data_dir, f"{name}.pdf")
+        if not os.path.exists(template_path):
+            with open(template_path, "wb") as f:
+                f.write(make_template(name))
+        if "imposition" not in tools:
+            continue
+        # 拼版的源文件就是工具二的输出：模板 + 一个二维码
+        source_dir = os.path.join(data_dir, f"sources_{name}")
+        os.makedirs(source_dir, exist_ok=True)
+        missing = [i for i in range(count) if not os.path.exists(os.path.join(source_dir, f"{i:06d}.pdf"))]
+        if missing:
+            with TemplateCompositor(_read(template_path), [SINGLE_RECT]) as compositor:
+                for index in missing:
+                    with open(os.path.join(source_dir, f"{index:06d}.pdf"), "wb") as f:
+                        f.write(compositor.render([_read(_qr_path(data_dir, index))]))
+
+
+# ===================================================================
+# 各工具的测量用例：返回 (处理条目数, 输出字节数)
+# ===================================================================
+def bench_single(data_dir, template, count, workers, out_dir):
+    out_path = os.path.join(out_dir, "single.zip")
+    items = ((f"{i:06d}.pdf", [_read(_qr_path(data_dir, i))]) for i in range(count))
+    done, _ = write_generated(out_path, _read(os.path.join(data_dir, f"{template}.pdf")), [SINGLE_RECT], items,
+                              workers=workers)
+    return done, os.path.getsize(out_path)
+
+
+def bench_dual(data_dir, template, count, workers, out_dir):
+    out_path = os.path.join(out_dir, "dual.zip")
+    items = ((f"{i:06d}.pdf", [_read(_qr_path(data_dir, i)), _read(_qr_path(data_dir, count - 1 - i))])
+             for i in range(count))
+    done, _ = write_generated(out_path, _read(os.path.join(data_dir, f"{template}.pdf")), DUAL_RECTS, items,
+                              workers=workers)
+    return done, os.path.getsize(out_path)
+
+
+def bench_imposition(data_dir, template, count, workers, out_dir):
+    out_path = os.path.join(out_dir, "imposition.zip")
+    source_dir = os.path.join(data_dir, f"sources_{template}")
+    named_sources = ((f"{i:06d}.pdf", _read(os.path.join(source_dir, f"{i:06d}.pdf"))) for i in range(count))
+    cells, sources, _ = collect_imposition_cells(named_sources)
+    cols, rows, gap_mm = IMPOSITION_GRID
+    write_imposition(out_path, cells, sources, cols, rows, mm_to_points(gap_mm), workers=workers)
+    return len(cells), os.path.getsize(out_path)
+
+
+def bench_placer(data_dir, template, count, workers, out_dir):
+    # 模拟在工具一里反复调整坐标：页面和二维码只解码一次，每次调整只重新合成预览
+    page_preview = PagePreview(_read(os.path.join(data_dir, f"{template}.pdf")))
+    qr = QrPreviewImage(_read(_qr_path(data_dir, 0)))
+    for i in range(count):
+        # 每 10 次调整一次尺寸，其余只移动位置
+        size = 85 + (i // 10) % 5 * 10
+        overview, detail = composite_preview(page_preview, qr, 45 + i % 50, 140 + i % 30, size, size)
+    # 输出体积记为每次调整后要显示的两张预览图的像素数据量
+    return count, len(overview.tobytes()) + len(detail.tobytes())
+
+
+BENCHMARKS = {
+    "single": bench_single,
+    "dual": bench_dual,
+    "imposition": bench_imposition,
+    "placer": bench_placer,
+}
+
+
+# ===================================================================
+# 执行与对比
+# ===================================================================
+def _vm_hwm_kb(pid="self"):
+    # 只在 Linux 上可用，其他平台峰值内存记为 None (对比时跳过)
+    # VmHWM 在 exec 时清零，spawn 出来的进程只反映自己；ru_maxrss 会跨 exec 继承父进程的峰值，不能用
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _child_pids():
+    pids = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # 进程名可能带空格和括号，从最后一个右括号之后取字段，第二个是父进程号
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == os.getpid():
+            pids.append(int(name))
+    return pids
+
+
+class PeakMemory:
+    # 用例进程自身的峰值，加上用例内部启动的各工作进程的峰值之和
+    # 工作进程退出后就读不到了，所以由后台线程定期采样，取每个进程最后一次读到的值
+    def __init__(self, interval=MEMORY_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._child_peaks = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        if _vm_hwm_kb() is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for pid in _child_pids():
+                peak = _vm_hwm_kb(pid)
+                if peak:
+                    self._child_peaks[pid] = max(peak, self._child_peaks.get(pid, 0))
+
+    @property
+    def mb(self):
+        own = _vm_hwm_kb()
+        if own is None:
+            return None
+        return round((own + sum(self._child_peaks.values())) / 1024, 1)
+
+
+def _measure(tool, data_dir, template, count, workers):
+    # 在独立的 spawn 子进程里执行，峰值内存只反映本用例 (见 PeakMemory)
+    out_dir = tempfile.mkdtemp(prefix="bench_", dir=data_dir)
+    try:
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            items, output_bytes = BENCHMARKS[tool](data_dir, template, count, workers, out_dir)
+            seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return {
+        "items": items,
+        "seconds": round(seconds, 3),
+        "items_per_sec": round(items / seconds, 2) if seconds else None,
+        "peak_rss_mb": memory.mb,
+        "output_bytes": output_bytes,
+    }
+
+
+def run_benchmarks(scales, templates=TEMPLATES, tools=TOOLS, workers=1, data_dir=DATA_DIR, log=print):
+    # 返回 {"meta": 环境信息, "results": {"工具/模板/规模": 指标}}
+    prepare_data(data_dir, templates, tools, max(scales))
+    results = {}
+    ctx = multiprocessing.get_context("spawn")
+    for tool in tools:
+        for template in templates:
+            for count in scales:
+                case = f"{tool}/{template}/{count}"
+                with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+                    results[case] = executor.submit(_measure, tool, data_dir, template, count, workers).result()
+                metrics = results[case]
+                log(f"{case:<32} {metrics['items_per_sec']:>10} 项/秒  峰值内存 {metrics['peak_rss_mb']} MB  "
+                    f"输出 {metrics['output_bytes']} 字节")
+    meta = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pymupdf": fitz.VersionBind,
+        "cpu_count": os.cpu_count(),
+        "workers": workers,
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    return {"meta": meta, "results": results}
+
+
+def compare_results(current, baseline, threshold=REGRESSION_THRESHOLD):
+    # 返回 (报告行, 退化数量)；只对比两边都有的用例
+    lines, regressions = [], 0
+    for key in ("python", "pymupdf", "cpu_count", "workers"):
+        if current["meta"].get(key) != baseline["meta"].get(key):
+            lines.append(f"⚠️ 运行环境与基线不同: {key} {baseline['meta'].get(key)} -> {current['meta'].get(key)}")
+    checks = (
+        ("items_per_sec", "吞吐量", -1),  # 越大越好
+        ("peak_rss_mb", "峰值内存", 1),  # 越小越好
+        ("output_bytes", "输出体积", 1),
+    )
+    for case, metrics in current["results"].items():
+        base = baseline["results"].get(case)
+        if base is None:
+            continue
+        parts, failed = [], False
+        for key, label, direction in checks:
+            if not metrics.get(key) or not base.get(key):
+                continue
+            change = metrics[key] / base[key] - 1
+            parts.append(f"{label} {change:+.1%}")
+            if change * direction > threshold:
+                failed = True
+        regressions += failed
+        lines.append(f"{'❌' if failed else '✅'} {case:<32} " + "  ".join(parts))
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PDF 工具箱性能基准")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES), help="每个用例的条目数，如 100 1000 10000")
+    parser.add_argument("--templates", nargs="+", choices=TEMPLATES, default=list(TEMPLATES), help="参与测试的模板")
+    parser.add_argument("--tools", nargs="+", choices=TOOLS, default=list(TOOLS), help="参与测试的工具")
+    parser.add_argument("--workers", type=int, default=1, help="并行进程数 (默认 1，结果更稳定)")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="合成数据的缓存目录")
+    parser.add_argument("--save", help="把结果保存为基线 JSON")
+    parser.add_argument("--compare", help="与这个基线 JSON 对比，有退化时返回码为 1")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="判定退化的变化比例")
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(args.scales, args.templates, args.tools, args.workers, args.data_dir)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=1)
+        print(f"基线已保存到 {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines, regressions = compare_results(current, baseline, args.threshold)
+        print("\n".join(lines))
+        if regressions:
+            print(f"有 {regressions} 个用例性能退化超过 {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+# jobs.py
+# 后台任务：批量生成/拼版放到后台线程执行，Streamlit 重新运行脚本时页面不会卡住，任务也不会被打断
+# 任务对象保存在 st.session_state 里，结果写在磁盘上；界面只需轮询任务的进度和状态
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 整个服务进程同时执行的任务数，更多的任务排队等待 (每个任务内部还会再开多个工作进程)
+MAX_RUNNING_JOBS = 2
+
+JOB_STATUS_LABELS = {
+    "queued": "排队中",
+    "running": "运行中",
+    "done": "已完成",
+    "failed": "失败",
+    "cancelled": "已取消",
+}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, title, total=None):
+        self.id = next(Job._ids)
+        self.title = title
+        self.total = total  # 总条目数，未知时为 None
+        self.done = 0
+        self.status = "queued"
+        self.result = None  # 任务函数的返回值
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def fraction(self):
+        if not self.total:
+            return None
+        return min(1.0, self.done / self.total)
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def cancel(self):
+        self._cancel.set()
+        # 还在排队的任务直接取消；运行中的任务在下一次 advance 时停止
+        if self.future is not None and self.future.cancel():
+            self.status = "cancelled"
+
+    def advance(self, count=1):
+        # 任务函数每完成一项调用一次 (可直接作为 progress 回调)；已请求取消时抛出 JobCancelled
+        self.done += count
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+
+class JobRunner:
+    def __init__(self, max_running=MAX_RUNNING_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix="pdf_job")
+
+    def submit(self, job, fn, *args, **kwargs):
+        # fn(job, *args, **kwargs) 在后台线程中执行，返回值存入 job.result
+        job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if job._cancel.is_set():
+            job.status = "cancelled"
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = "done"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
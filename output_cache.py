@@ -0,0 +1,107 @@
+# output_cache.py
+# 输出缓存：生成的单个PDF按输入内容的哈希存到磁盘，重跑同一批任务时未变化的条目直接复用
+# 超过容量上限时按最近使用时间淘汰最旧的文件
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+# 合成/拼版的输出格式有变化时改这个版本号，旧缓存自然失效
+CACHE_VERSION = 1
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "pdf_toolbox_cache")
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+# 淘汰时删到容量上限的这个比例以下，避免每写一个文件就淘汰一次
+EVICT_TARGET = 0.9
+
+
+def digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def cache_key(*parts):
+    # parts: 可 JSON 序列化的参数 (内容用 digest() 的结果代替原始字节)
+    payload = json.dumps([CACHE_VERSION, *parts], ensure_ascii=False, sort_keys=True, default=str)
+    return digest(payload.encode("utf-8"))
+
+
+class OutputCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None  # 第一次写入时扫描目录得到
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        # 按前两位分目录，单个目录里的文件数不会太多
+        return os.path.join(self.cache_dir, key[:2], key + ".pdf")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # 更新修改时间作为最近使用时间，淘汰时按它排序
+            os.utime(path)
+        except FileNotFoundError:
+            # 可能刚好被其他进程淘汰
+            return None
+        return data
+
+    def touch(self, key):
+        # 只标记为最近使用、不读取内容，返回是否存在
+        try:
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，多个任务/进程同时写同一个键也不会读到半个文件
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        with self._lock:
+            # 覆盖已有的键时先扣掉旧文件的大小
+            try:
+                old_size = os.path.getsize(path)
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(tmp_path, path)
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data) - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".pdf"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TARGET
+        for _, file_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+        self._size = size
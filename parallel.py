@@ -0,0 +1,154 @@
+# parallel.py
+# 多进程批量执行：把二维码合成 / 拼版任务分块分发到多个工作进程，结果按输入顺序返回
+import collections
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf_engine import TemplateCompositor, impose_sheet, make_encoder
+
+# 每个任务包含的二维码数量：太小则进程间通信开销占比高，太大则负载不均
+DEFAULT_CHUNK_SIZE = 32
+
+# 工作进程内的状态，由 initializer 设置
+_compositor = None
+_preprocessor = None
+_impose_params = None
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _run_ordered(fn, chunks, workers, initializer, initargs):
+    # Streamlit 服务端是多线程的，fork 不安全，统一用 spawn 启动工作进程
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=initializer, initargs=initargs) as executor:
+        # 最多同时挂起 workers*2 个分块，按提交顺序取回结果，避免一次性把全部输入塞进进程池
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(executor.submit(fn, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+# ===================================================================
+# 二维码合成
+# ===================================================================
+def _render_chunk(compositor, chunk):
+    results = []
+    for name, images in chunk:
+        if images is None:
+            # 调用方已有结果 (如命中输出缓存)，只在结果流里占位
+            results.append((name, None, None))
+            continue
+        try:
+            results.append((name, compositor.render(images), None))
+        except Exception as e:
+            results.append((name, None, str(e)))
+    return results
+
+
+def _init_compositor(template_data, rects, image_options):
+    global _compositor
+    _compositor = TemplateCompositor(template_data, rects, image_options=image_options)
+
+
+def _composite_chunk(chunk):
+    return _render_chunk(_compositor, chunk)
+
+
+def composite_items(template_data, rects, items, image_options=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    # items: 可迭代的 (输出文件名, [各位置的图片字节])；image_options 见 pdf_engine.make_encoder
+    # 按输入顺序依次产出 (输出文件名, PDF字节, 错误信息)，出错时 PDF字节 为 None
+    # 图片为 None 的条目不合成，原样产出 (输出文件名, None, None)，供调用方按顺序插入已有结果
+    rects = [tuple(r) for r in rects]
+    chunks = _chunks(items, chunk_size)
+    if workers <= 1:
+        with TemplateCompositor(template_data, rects, image_options=image_options) as compositor:
+            for chunk in chunks:
+                yield from _render_chunk(compositor, chunk)
+        return
+    yield from _run_ordered(_composite_chunk, chunks, workers, _init_compositor, (template_data, rects, image_options))
+
+
+# ===================================================================
+# 图片预编码 (多页输出时只在工作进程里做图片编码，页面由主进程按顺序写入)
+# ===================================================================
+def _preprocess_chunk(preprocessor, chunk):
+    results = []
+    for name, images in chunk:
+        try:
+            results.append((name, preprocessor.encode(images), None))
+        except Exception as e:
+            results.append((name, None, str(e)))
+    return results
+
+
+def _init_preprocessor(rects, image_options):
+    global _preprocessor
+    _preprocessor = make_encoder(rects, image_options)
+
+
+def _encode_chunk(chunk):
+    return _preprocess_chunk(_preprocessor, chunk)
+
+
+def encode_items(items, rects, image_options=None, workers=1, chunk_size=DEFAULT_CHUNK_SIZE):
+    # items: 可迭代的 (名称, [各位置的图片字节])；按输入顺序依次产出 (名称, [EncodedImage], 错误信息)
+    rects = [tuple(r) for r in rects]
+    chunks = _chunks(items, chunk_size)
+    if workers <= 1:
+        preprocessor = make_encoder(rects, image_options)
+        for chunk in chunks:
+            yield from _preprocess_chunk(preprocessor, chunk)
+        return
+    yield from _run_ordered(_encode_chunk, chunks, workers, _init_preprocessor, (rects, image_options))
+
+
+# ===================================================================
+# 拼版
+# ===================================================================
+def _impose_one(sheet, cols, rows, gap_pt, dedupe_resources):
+    if sheet is None:
+        # 调用方已有结果 (如命中输出缓存)，只在结果流里占位
+        return None, []
+    cells, sources = sheet
+    try:
+        return impose_sheet(cells, sources, cols, rows, gap_pt, dedupe_resources)
+    except Exception as e:
+        return None, [f"  -> ⚠️ 警告: 本批拼版失败: {e}"]
+
+
+def _init_imposition(cols, rows, gap_pt, dedupe_resources):
+    global _impose_params
+    _impose_params = (cols, rows, gap_pt, dedupe_resources)
+
+
+def _impose_chunk(chunk):
+    return [_impose_one(sheet, *_impose_params) for sheet in chunk]
+
+
+def impose_sheets(sheets, cols, rows, gap_pt, dedupe_resources=True, workers=1):
+    # sheets: 可迭代的 (cells, sources)，每一项生成一张拼版 (见 pdf_engine.split_sheets)
+    # 按输入顺序依次产出 (PDF字节, 日志列表)，整批失败时 PDF字节 为 None；为 None 的项产出 (None, [])
+    if workers <= 1:
+        for sheet in sheets:
+            yield _impose_one(sheet, cols, rows, gap_pt, dedupe_resources)
+        return
+    # 每张拼版本身计算量就较大，一批即一个任务；只把这一张用到的源文件发给工作进程
+    yield from _run_ordered(_impose_chunk, _chunks(sheets, 1), workers, _init_imposition,
+                            (cols, rows, gap_pt, dedupe_resources))
@@ -0,0 +1,603 @@
+# pdf_engine.py
+# 批量合成引擎：模板只解析一次，之后每个输出只替换二维码图片对象
+import collections
+import hashlib
+import io
+import struct
+import zlib
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageChops
+
+from vector_qr import VectorQrEncoder
+
+# 重新压缩像素数据时使用的 zlib 级别：二维码图案简单，低级别已足够小且快得多
+FLATE_LEVEL = 1
+
+
+# ===================================================================
+# 图片编码：把 PNG/JPEG 原始字节转换成 PDF 图片对象 (字典 + 数据流)
+# ===================================================================
+class EncodedImage:
+    def __init__(self, width, height, colorspace, bpc, filter_name, data, decode=None, smask=None,
+                 decode_parms=None):
+        self.width = width
+        self.height = height
+        self.colorspace = colorspace  # "/DeviceGray"、"/DeviceRGB"、"/DeviceCMYK" 或 Indexed 数组
+        self.bpc = bpc  # BitsPerComponent
+        self.filter_name = filter_name  # "/FlateDecode" 或 "/DCTDecode"
+        self.data = data  # 已压缩的数据流
+        self.decode = decode  # 可选的 /Decode 数组
+        self.smask = smask  # 透明通道 (另一个 EncodedImage)，没有则为 None
+        self.decode_parms = decode_parms  # 可选的 /DecodeParms 字典 (PNG 预测器)
+        self.digest = None  # 预处理缓存键，同一份输出里摘要相同的图片只写入一次
+
+    @property
+    def nbytes(self):
+        return len(self.data) + (self.smask.nbytes if self.smask is not None else 0)
+
+    def pdf_dict(self, smask_xref=0):
+        parts = [
+            "<</Type/XObject/Subtype/Image",
+            f"/Width {self.width}/Height {self.height}",
+            f"/ColorSpace{self.colorspace}/BitsPerComponent {self.bpc}",
+        ]
+        if self.decode:
+            parts.append(f"/Decode[{self.decode}]")
+        if smask_xref:
+            parts.append(f"/SMask {smask_xref} 0 R")
+        parts.append(">>")
+        return "".join(parts)
+
+
+def _split_alpha(img):
+    # 统一为 PDF 能直接描述的像素格式，返回 (图像, 透明通道或None)
+    if img.mode == "P":
+        img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+    elif img.mode not in ("1", "L", "LA", "RGB", "RGBA", "CMYK"):
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+
+    alpha = None
+    if img.mode in ("LA", "RGBA"):
+        alpha = img.getchannel("A")
+        img = img.convert("L" if img.mode == "LA" else "RGB")
+        # 完全不透明的透明通道没有意义，直接丢弃
+        if alpha.getextrema() == (255, 255):
+            alpha = None
+    return img, alpha
+
+
+def _encode_pixels(img, alpha=None):
+    # img 为 1/L/RGB/CMYK 模式，alpha 为 1 或 L 模式 (单独作为 SMask)
+    smask = _encode_pixels(alpha) if alpha is not None else None
+    if img.mode == "1":
+        colorspace, bpc = "/DeviceGray", 1
+    elif img.mode == "L":
+        colorspace, bpc = "/DeviceGray", 8
+    elif img.mode == "CMYK":
+        colorspace, bpc = "/DeviceCMYK", 8
+    else:
+        colorspace, bpc = "/DeviceRGB", 8
+
+    return EncodedImage(img.width, img.height, colorspace, bpc, "/FlateDecode",
+                        zlib.compress(img.tobytes(), FLATE_LEVEL), smask=smask)
+
+
+def _flate_image(img):
+    return _encode_pixels(*_split_alpha(img))
+
+
+def _png_passthrough(data):
+    # 不透明、非隔行的 PNG：IDAT 本身就是带 PNG 预测器的 zlib 数据，可直接作为 FlateDecode 流嵌入
+    if data[:8] != b"\x89PNG\r\n\x1a\n":
+        return None
+    pos = 8
+    ihdr, palette, idat = None, None, []
+    while pos + 8 <= len(data):
+        length, ctype = struct.unpack(">I4s", data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if ctype == b"IHDR":
+            ihdr = struct.unpack(">IIBBBBB", chunk)
+        elif ctype == b"PLTE":
+            palette = chunk
+        elif ctype == b"tRNS":
+            return None
+        elif ctype == b"IDAT":
+            idat.append(chunk)
+        elif ctype == b"IEND":
+            break
+    if ihdr is None or not idat:
+        return None
+    width, height, bpc, color_type, _, _, interlace = ihdr
+    if interlace or bpc > 8:
+        return None
+    if color_type == 0:
+        colorspace, colors = "/DeviceGray", 1
+    elif color_type == 2:
+        colorspace, colors = "/DeviceRGB", 3
+    elif color_type == 3 and palette:
+        colorspace = f"[/Indexed/DeviceRGB {len(palette) // 3 - 1}<{palette.hex()}>]"
+        colors = 1
+    else:
+        return None  # 带透明通道，需要解码后拆分
+    parms = f"<</Predictor 15/Colors {colors}/BitsPerComponent {bpc}/Columns {width}>>"
+    return EncodedImage(width, height, colorspace, bpc, "/FlateDecode", b"".join(idat), decode_parms=parms)
+
+
+def encode_image(image_data):
+    encoded = _png_passthrough(image_data)
+    if encoded is not None:
+        return encoded
+    img = Image.open(io.BytesIO(image_data))
+    # JPEG 原样嵌入 (DCTDecode)，无需解码再压缩
+    if img.format == "JPEG" and img.mode in ("L", "RGB", "CMYK"):
+        colorspace = {"L": "/DeviceGray", "RGB": "/DeviceRGB", "CMYK": "/DeviceCMYK"}[img.mode]
+        # Adobe 生成的 CMYK JPEG 是反相存储的
+        decode = "1 0 1 0 1 0 1 0" if img.mode == "CMYK" and "adobe" in img.info else None
+        return EncodedImage(img.width, img.height, colorspace, 8, "/DCTDecode", image_data, decode=decode)
+    img.load()
+    return _flate_image(img)
+
+
+# ===================================================================
+# 图片预处理：按目标打印DPI缩小，并转换为紧凑的灰度/黑白格式
+# ===================================================================
+# auto：黑白二维码转 1-bit，灰度图转 8-bit 灰度，彩色保持不变
+COLOR_MODES = ("auto", "color", "gray", "bilevel")
+
+
+def _pick_color_mode(img):
+    rgb = img.convert("RGB")
+    r, g, b = rgb.split()
+    # 三个通道几乎相同才算灰度图
+    if max(ImageChops.difference(r, g).getextrema()[1], ImageChops.difference(g, b).getextrema()[1]) > 16:
+        return "color"
+    hist = rgb.convert("L").histogram()
+    # 绝大多数像素都接近纯黑或纯白，视为黑白图
+    if sum(hist[:64]) + sum(hist[192:]) >= 0.99 * sum(hist):
+        return "bilevel"
+    return "gray"
+
+
+def normalize_image(image_data, rect, target_dpi=None, color_mode="color"):
+    # 按放置矩形和目标DPI计算所需像素数，只缩小不放大 (合成时会保持比例放进矩形)
+    if not target_dpi and color_mode == "color":
+        return encode_image(image_data)
+    img = Image.open(io.BytesIO(image_data))
+    img.load()
+    img, alpha = _split_alpha(img)
+    # 在缩放之前判断颜色类型，缩放产生的灰色边缘不影响判断
+    if color_mode == "auto":
+        color_mode = _pick_color_mode(img)
+
+    if target_dpi:
+        rect = fitz.Rect(rect)
+        scale = min(rect.width / 72 * target_dpi / img.width, rect.height / 72 * target_dpi / img.height)
+        if scale < 1:
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            if img.mode == "1":
+                img = img.convert("L")
+            img = img.resize(size, Image.LANCZOS)
+            if alpha is not None:
+                alpha = alpha.resize(size, Image.LANCZOS)
+
+    if color_mode == "bilevel":
+        # 先在灰度下缩放再取阈值，模块边缘比直接 1-bit 缩放更齐整
+        img = img.convert("L").point(lambda v: 255 if v >= 128 else 0, "1")
+        if alpha is not None:
+            alpha = alpha.point(lambda v: 255 if v >= 128 else 0, "1")
+    elif color_mode == "gray":
+        img = img.convert("L")
+    elif img.mode == "1":
+        img = img.convert("L")
+    return _encode_pixels(img, alpha)
+
+
+class ImagePreprocessor:
+    def __init__(self, rects, target_dpi=None, color_mode="color", max_cache_bytes=64 * 1024 * 1024):
+        self.rects = [fitz.Rect(r) for r in rects]
+        self.target_dpi = target_dpi
+        self.color_mode = color_mode
+        self.max_cache_bytes = max_cache_bytes
+        # 按 (内容哈希, 放置尺寸) 缓存编码结果，重复的二维码只处理一次；超出容量时淘汰最久未用的
+        self._cache = collections.OrderedDict()
+        self._cache_bytes = 0
+
+    def encode(self, images):
+        # images: 与 rects 一一对应的图片原始字节，返回 [EncodedImage]
+        if len(images) != len(self.rects):
+            raise ValueError(f"需要 {len(self.rects)} 张图片，实际提供了 {len(images)} 张")
+        return [self._encode_one(data, rect) for data, rect in zip(images, self.rects)]
+
+    def _encode_one(self, data, rect):
+        key = f"{hashlib.sha1(data).hexdigest()}:{rect.width:.2f}x{rect.height:.2f}"
+        enc = self._cache.get(key)
+        if enc is not None:
+            self._cache.move_to_end(key)
+            return enc
+        enc = normalize_image(data, rect, self.target_dpi, self.color_mode)
+        enc.digest = key
+        self._cache[key] = enc
+        self._cache_bytes += enc.nbytes
+        while self._cache_bytes > self.max_cache_bytes and len(self._cache) > 1:
+            _, old = self._cache.popitem(last=False)
+            self._cache_bytes -= old.nbytes
+        return enc
+
+
+def make_encoder(rects, image_options=None):
+    # image_options 带 vector=True 时输入是二维码内容文本 (矢量绘制，其余键为 error、border)
+    # 否则输入是图片字节 (其余键为 target_dpi、color_mode)
+    options = dict(image_options or {})
+    if options.pop("vector", False):
+        return VectorQrEncoder(rects, **options)
+    return ImagePreprocessor(rects, **options)
+
+
+# ===================================================================
+# 模板合成器：模板解析一次，每个二维码位置预留一个固定的图片对象
+# ===================================================================
+class TemplateCompositor:
+    def __init__(self, template_data, rects, page_no=0, image_options=None):
+        # image_options: 见 make_encoder
+        self.rects = [fitz.Rect(r) for r in rects]
+        self.page_no = page_no
+        self.preprocessor = make_encoder(rects, image_options)
+        self.doc = fitz.open(stream=template_data, filetype="pdf")
+        page = self.doc[page_no]
+        self._slots = []
+        for rect in self.rects:
+            # 每个位置放一个铺满放置矩形的单位正方形 Form XObject，里面再引用真正的图片对象
+            # 换图时只替换图片对象，宽高比变化时只改 Form 的 /Matrix，页面内容始终不变
+            # (占位图对象自己创建：insert_image(stream=...) 会把相同的占位图去重成同一个对象)
+            placeholder = EncodedImage(1, 1, "/DeviceGray", 8, "/FlateDecode", zlib.compress(b"\xff"))
+            img_xref = _add_image_object(self.doc, placeholder)
+            form_xref = self.doc.get_new_xref()
+            # /Width、/Height 只供 insert_image 读取，阅读器会忽略
+            self.doc.update_object(form_xref, "<</Type/XObject/Subtype/Form/BBox[0 0 1 1]/Matrix[1 0 0 1 0 0]"
+                                              f"/Resources<</XObject<</Im {img_xref} 0 R>>>>/Width 1/Height 1>>")
+            self.doc.update_stream(form_xref, b"/Im Do", compress=0)
+            page.insert_image(rect, xref=form_xref, keep_proportion=False, overlay=True)
+            self._slots.append({"rect": rect, "form_xref": form_xref, "img_xref": img_xref, "smask_xref": 0,
+                                "matrix": None, "digest": None})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.doc.close()
+
+    def _put_image(self, doc, slot, enc):
+        # 和上一次是同一张图 (重复的二维码) 时无需重写
+        if enc.digest is not None and slot["digest"] == enc.digest:
+            return
+        slot["digest"] = enc.digest
+        matrix = fit_matrix(slot["rect"], enc.width, enc.height)
+        if matrix != slot["matrix"]:
+            doc.xref_set_key(slot["form_xref"], "Matrix", matrix)
+            slot["matrix"] = matrix
+        smask_xref = 0
+        if enc.smask is not None:
+            if not slot["smask_xref"]:
+                slot["smask_xref"] = doc.get_new_xref()
+            smask_xref = slot["smask_xref"]
+            _write_stream_object(doc, smask_xref, enc.smask)
+        elif slot["smask_xref"]:
+            # 本次图片没有透明通道，清空上一次留下的 SMask
+            doc.update_object(slot["smask_xref"], "null")
+        _write_stream_object(doc, slot["img_xref"], enc, smask_xref)
+
+    def render(self, images):
+        # images: 与 rects 一一对应的图片原始字节 (矢量模式下为二维码内容)，返回合成后的 PDF 字节
+        encoded = self.preprocessor.encode(images)
+        for slot, enc in zip(self._slots, encoded):
+            self._put_image(self.doc, slot, enc)
+        return self.doc.tobytes()
+
+
+def fit_rect(rect, width, height):
+    # 按图片宽高比缩放到放置矩形内并居中 (insert_image 的 keep_proportion 对正方形图片会拉伸铺满，不用它)
+    scale = min(rect.width / width, rect.height / height)
+    w, h = width * scale, height * scale
+    x0 = rect.x0 + (rect.width - w) / 2
+    y0 = rect.y0 + (rect.height - h) / 2
+    return fitz.Rect(x0, y0, x0 + w, y0 + h)
+
+
+def fit_matrix(rect, width, height):
+    # fit_rect 换算到单位正方形内 (PDF 坐标 y 轴向上，居中时上下对称不受影响)，返回 /Matrix 数组文本
+    fitted = fit_rect(rect, width, height)
+    sx = fitted.width / rect.width
+    sy = fitted.height / rect.height
+    return f"[{sx:.6f} 0 0 {sy:.6f} {(1 - sx) / 2:.6f} {(1 - sy) / 2:.6f}]"
+
+
+def _add_image_object(doc, enc):
+    # 新建图片对象 (含 SMask)，返回其 xref
+    smask_xref = 0
+    if enc.smask is not None:
+        smask_xref = doc.get_new_xref()
+        _write_stream_object(doc, smask_xref, enc.smask)
+    img_xref = doc.get_new_xref()
+    _write_stream_object(doc, img_xref, enc, smask_xref)
+    return img_xref
+
+
+def _reuse_image_object(doc, enc, known_xrefs):
+    # 摘要相同的图片在同一份输出里只写入一次；known_xrefs 为该输出的 {摘要: xref}
+    if enc.digest is None:
+        return _add_image_object(doc, enc)
+    xref = known_xrefs.get(enc.digest)
+    if xref is None:
+        xref = known_xrefs[enc.digest] = _add_image_object(doc, enc)
+    return xref
+
+
+def _write_stream_object(doc, xref, enc, smask_xref=0):
+    doc.update_object(xref, enc.pdf_dict(smask_xref))
+    # 数据已经压缩好，原样写入 (这一步会清掉 /Filter 和 /DecodeParms)，再补上这两项
+    doc.update_stream(xref, enc.data, compress=0)
+    doc.xref_set_key(xref, "Filter", enc.filter_name)
+    if enc.decode_parms:
+        doc.xref_set_key(xref, "DecodeParms", enc.decode_parms)
+
+
+# ===================================================================
+# 多页合成器：所有二维码写进同一个PDF，模板作为一个 Form XObject 只存一份
+# ===================================================================
+class MultiPageCompositor:
+    def __init__(self, template_data, rects, page_no=0, image_options=None):
+        self._template = fitz.open(stream=template_data, filetype="pdf")
+        self.page_no = page_no
+        self.rects = [fitz.Rect(r) for r in rects]
+        self.preprocessor = make_encoder(rects, image_options)
+        self.doc = fitz.open()
+        self._toc = []
+        self._image_xrefs = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.doc.close()
+        self._template.close()
+
+    @property
+    def page_count(self):
+        return self.doc.page_count
+
+    def add_page(self, images, label=None):
+        self.add_encoded_page(self.preprocessor.encode(images), label)
+
+    def add_encoded_page(self, encoded_images, label=None):
+        # encoded_images: 与 rects 一一对应的 EncodedImage；label 会作为书签标题
+        # 和单个PDF输出一样，模板的每一页都输出，二维码只放在 page_no 页上
+        if len(encoded_images) != len(self.rects):
+            raise ValueError(f"需要 {len(self.rects)} 张图片，实际提供了 {len(encoded_images)} 张")
+        first_page = self.doc.page_count + 1
+        for pno, template_page in enumerate(self._template):
+            page = self.doc.new_page(width=template_page.rect.width, height=template_page.rect.height)
+            # 同一个源页面重复 show_pdf_page 时 PyMuPDF 会复用第一次生成的 Form XObject
+            # 注意：模板页上的注释/表单域不会被带过来，只保留页面内容 (界面上有提示)
+            page.show_pdf_page(page.rect, self._template, pno)
+            if pno != self.page_no:
+                continue
+            for rect, enc in zip(self.rects, encoded_images):
+                page.insert_image(fit_rect(rect, enc.width, enc.height),
+                                  xref=_reuse_image_object(self.doc, enc, self._image_xrefs), keep_proportion=False, overlay=True)
+        if label:
+            self._toc.append([1, label, first_page])
+
+    def save(self, path):
+        if self._toc:
+            self.doc.set_toc(self._toc)
+        # 图片和模板数据流都已压缩，deflate 只会压缩每页那几行绘制指令
+        self.doc.save(path, deflate=True)
+
+
+# ===================================================================
+# 拼版：把源PDF的各页按网格放到大页面上
+# 相同内容的源文件只打开一次，同一源页面在一份输出里只导入一次 (复用同一个 Form XObject)
+# ===================================================================
+def mm_to_points(mm):
+    return mm * 72 / 25.4
+
+
+def grid_layout(cols, rows, gap_pt, item_width, item_height):
+    # 返回 (页面宽, 页面高, [按行优先排列的单元格矩形])
+    page_width = (cols * item_width) + (cols - 1) * gap_pt + (2 * gap_pt)
+    page_height = (rows * item_height) + (rows - 1) * gap_pt + (2 * gap_pt)
+    rects = []
+    for idx in range(cols * rows):
+        row = idx // cols
+        col = idx % cols
+        x0 = gap_pt + col * (item_width + gap_pt)
+        y0 = gap_pt + row * (item_height + gap_pt)
+        rects.append(fitz.Rect(x0, y0, x0 + item_width, y0 + item_height))
+    return page_width, page_height, rects
+
+
+def collect_imposition_cells(named_sources):
+    # named_sources: 可迭代的 (文件名, PDF字节)
+    # 返回 (cells, sources, logs)：cells 为 [(显示名, 内容哈希, 页码)]，每个源页面占一个单元格；
+    # sources 为 {内容哈希: PDF字节}，内容相同的文件只保留一份
+    cells, sources, page_counts, logs = [], {}, {}, []
+    for name, pdf_data in named_sources:
+        key = hashlib.sha1(pdf_data).hexdigest()
+        if key not in sources:
+            try:
+                with fitz.open(stream=pdf_data, filetype="pdf") as doc:
+                    page_counts[key] = doc.page_count
+            except Exception as e:
+                logs.append(f"  -> ⚠️ 警告: 读取文件 '{name}' 时出错: {e}")
+                continue
+            sources[key] = pdf_data
+        page_count = page_counts[key]
+        for pno in range(page_count):
+            label = name if page_count == 1 else f"{name} (第{pno + 1}页)"
+            cells.append((label, key, pno))
+    return cells, sources, logs
+
+
+def split_sheets(cells, sources, per_sheet):
+    # 按每张拼版的单元格数切分，依次产出 (该张的 cells, 该张用到的 sources)
+    for start in range(0, len(cells), per_sheet):
+        sheet_cells = cells[start:start + per_sheet]
+        yield sheet_cells, {key: sources[key] for _, key, _ in sheet_cells}
+
+
+class SheetImposer:
+    def __init__(self, cols, rows, gap_pt):
+        self.cols = cols
+        self.rows = rows
+        self.gap_pt = gap_pt
+        self._docs = {}  # 内容哈希 -> 打开的源文档
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for doc in self._docs.values():
+            doc.close()
+        self._docs.clear()
+
+    def _source_doc(self, key, sources):
+        doc = self._docs.get(key)
+        if doc is None:
+            doc = fitz.open(stream=sources[key], filetype="pdf")
+            self._docs[key] = doc
+        return doc
+
+    def add_sheet(self, out_doc, cells, sources):
+        # 在 out_doc 末尾新增一张拼版页，返回日志列表
+        logs = []
+        # 以本张第一个单元格的页面尺寸作为单元格尺寸
+        _, first_key, first_pno = cells[0]
+        item_rect = self._source_doc(first_key, sources)[first_pno].rect
+        page_width, page_height, rects = grid_layout(self.cols, self.rows, self.gap_pt,
+                                                     item_rect.width, item_rect.height)
+        page = out_doc.new_page(width=page_width, height=page_height)
+        for idx, ((name, key, pno), target_rect) in enumerate(zip(cells, rects)):
+            row = idx // self.cols
+            col = idx % self.cols
+            try:
+                # 同一源文档对象的同一页，PyMuPDF 会复用已导入的 Form XObject
+                page.show_pdf_page(target_rect, self._source_doc(key, sources), pno)
+                logs.append(f"  -> 已将 '{name}' 放置在第 {row + 1} 行, 第 {col + 1} 列")
+            except Exception as e:
+                logs.append(f"  -> ⚠️ 警告: 放置文件 '{name}' 时出错: {e}")
+        unique_pages = len({(key, pno) for _, key, pno in cells})
+        logs.append(f"  -> 本张 {len(cells)} 个单元格，实际导入 {unique_pages} 个不同页面")
+        return logs
+
+
+def _save_options(dedupe_resources):
+    # 相同源页面已经只导入一次；garbage=4 只用于合并不同源文件之间的重复资源 (如相同字体)
+    return {"garbage": 4 if dedupe_resources else 0, "deflate": True}
+
+
+def impose_sheet(cells, sources, cols, rows, gap_pt, dedupe_resources=True):
+    # 生成一张独立的拼版PDF，返回 (PDF字节, 日志列表)
+    with SheetImposer(cols, rows, gap_pt) as imposer, fitz.open() as out_doc:
+        logs = imposer.add_sheet(out_doc, cells, sources)
+        pdf_bytes = out_doc.tobytes(**_save_options(dedupe_resources))
+    return pdf_bytes, logs
+
+
+def impose_all(sheets, cols, rows, gap_pt, path, dedupe_resources=True, progress=None):
+    # sheets: [(cells, sources), ...]；所有拼版页写进同一个PDF，源页面在整份文件里只导入一次；返回日志列表
+    # progress: 可选回调，每完成一张拼版调用一次
+    logs = []
+    with SheetImposer(cols, rows, gap_pt) as imposer, fitz.open() as out_doc:
+        for i, (cells, sources) in enumerate(sheets):
+            logs.append(f"\n📄 正在处理第 {i+1}/{len(sheets)} 批...")
+            logs.extend(imposer.add_sheet(out_doc, cells, sources))
+            if progress:
+                progress(1)
+        out_doc.save(path, **_save_options(dedupe_resources))
+    return logs
+
+
+# ===================================================================
+# 合成+拼版一步完成：模板和二维码直接放进拼版单元格，不再生成中间的单个PDF
+# ===================================================================
+class FusedImposer:
+    def __init__(self, template_data, rects, cols, rows, gap_pt, page_no=0):
+        self._template = fitz.open(stream=template_data, filetype="pdf")
+        self.page_no = page_no
+        self.rects = [fitz.Rect(r) for r in rects]
+        self.cols = cols
+        self.rows = rows
+        # 和先生成再拼版 (工具四) 一样，每个条目的模板各页依次占用连续的单元格
+        self.pages_per_item = self._template.page_count
+        # 单元格尺寸即放二维码的模板页尺寸，二维码位置相对单元格左上角平移即可
+        item_rect = self._template[page_no].rect
+        self.page_width, self.page_height, self.cell_rects = grid_layout(
+            cols, rows, gap_pt, item_rect.width, item_rect.height)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._template.close()
+
+    @property
+    def per_sheet(self):
+        return self.cols * self.rows
+
+    def _add_sheet(self, out_doc, batch, image_xrefs):
+        # batch: [(模板页码, [EncodedImage, ...]), ...]，每项对应一个单元格；image_xrefs 为该输出已写入的图片
+        page = out_doc.new_page(width=self.page_width, height=self.page_height)
+        for (pno, encoded_images), cell in zip(batch, self.cell_rects):
+            # 同一模板页在同一份输出里只导入一次，之后每个单元格都复用这个 Form XObject
+            page.show_pdf_page(cell, self._template, pno)
+            if pno != self.page_no:
+                continue
+            offset = (cell.x0, cell.y0, cell.x0, cell.y0)
+            for rect, enc in zip(self.rects, encoded_images):
+                page.insert_image(fit_rect(rect + offset, enc.width, enc.height),
+                                  xref=_reuse_image_object(out_doc, enc, image_xrefs), keep_proportion=False, overlay=True)
+
+    def _batches(self, encoded_items):
+        batch = []
+        for encoded_images in encoded_items:
+            for pno in range(self.pages_per_item):
+                batch.append((pno, encoded_images))
+                if len(batch) == self.per_sheet:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def iter_sheets(self, encoded_items):
+        # encoded_items: 可迭代的 [EncodedImage, ...] (与 rects 一一对应)
+        # 每凑满一张就输出一个独立的拼版PDF，依次产出 PDF字节
+        for batch in self._batches(encoded_items):
+            with fitz.open() as out_doc:
+                self._add_sheet(out_doc, batch, {})
+                pdf_bytes = out_doc.tobytes(deflate=True)
+            yield pdf_bytes
+
+    def write_all(self, encoded_items, path):
+        # 所有拼版页写进同一个PDF，模板在整份文件里只存一份；返回拼版张数
+        image_xrefs = {}
+        with fitz.open() as out_doc:
+            for batch in self._batches(encoded_items):
+                self._add_sheet(out_doc, batch, image_xrefs)
+            sheet_count = out_doc.page_count
+            if sheet_count:
+                out_doc.save(path, deflate=True)
+        return sheet_count
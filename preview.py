@@ -0,0 +1,72 @@
+# preview.py
+# 工具一的预览合成：整页渲染和二维码解码结果可缓存复用，调整坐标时只重新合成二维码附近的小区域
+import functools
+import io
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+PREVIEW_DPI = 200
+# 整页预览缩小到这个像素宽度以内，浏览器里显示不出更多细节
+OVERVIEW_MAX_WIDTH = 1200
+# 局部高清预览在二维码四周额外保留的宽度 (点)
+CROP_MARGIN_PT = 36
+
+
+class PagePreview:
+    def __init__(self, pdf_data, dpi=PREVIEW_DPI, page_no=0):
+        with fitz.open(stream=pdf_data, filetype="pdf") as doc:
+            page = doc[page_no]
+            # PDF页面的原始点尺寸，用于设置输入框的最大值
+            self.width_pt = page.rect.width
+            self.height_pt = page.rect.height
+            pix = page.get_pixmap(dpi=dpi)
+            self.hires = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+        self.zoom = dpi / 72.0
+        self.overview_scale = min(1.0, OVERVIEW_MAX_WIDTH / self.hires.width)
+        if self.overview_scale < 1.0:
+            size = (max(1, int(self.hires.width * self.overview_scale)),
+                    max(1, int(self.hires.height * self.overview_scale)))
+            self.overview = self.hires.resize(size, Image.LANCZOS)
+        else:
+            self.overview = self.hires
+
+
+class QrPreviewImage:
+    def __init__(self, qr_data):
+        self.image = Image.open(io.BytesIO(qr_data)).convert("RGBA")
+        # 最近用过的几个尺寸缓存起来，只改坐标不改尺寸时不用重新缩放
+        self.resized = functools.lru_cache(maxsize=8)(self._resize)
+
+    def _resize(self, size):
+        return self.image.resize(size, Image.LANCZOS)
+
+
+def _scaled_box(x, y, w, h, factor):
+    # 点坐标换算成像素坐标，尺寸至少 1x1 像素
+    return int(x * factor), int(y * factor), max(1, int(w * factor)), max(1, int(h * factor))
+
+
+def composite_preview(page_preview, qr, x, y, w, h):
+    # 返回 (整页缩略预览, 二维码局部高清预览)，两者都是新图，不会改动缓存里的底图
+    factor = page_preview.zoom * page_preview.overview_scale
+    px, py, pw, ph = _scaled_box(x, y, w, h, factor)
+    overview = page_preview.overview.copy()
+    small_qr = qr.resized((pw, ph))
+    overview.paste(small_qr, (px, py), small_qr)
+
+    # 只裁出二维码附近的高分辨率区域来合成
+    zoom = page_preview.zoom
+    px, py, pw, ph = _scaled_box(x, y, w, h, zoom)
+    margin = int(CROP_MARGIN_PT * zoom)
+    box = (
+        max(0, px - margin),
+        max(0, py - margin),
+        min(page_preview.hires.width, px + pw + margin),
+        min(page_preview.hires.height, py + ph + margin),
+    )
+    detail = page_preview.hires.crop(box)
+    big_qr = qr.resized((pw, ph))
+    detail.paste(big_qr, (px - box[0], py - box[1]), big_qr)
+    return overview, detail
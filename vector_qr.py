@@ -0,0 +1,132 @@
+# vector_qr.py
+# 矢量二维码：直接由二维码内容编码出模块矩阵，用矩形路径画成 Form XObject，无需上传/解码图片
+import csv
+import hashlib
+import io
+import re
+import zlib
+
+import segno
+
+QR_ERROR_LEVELS = ("L", "M", "Q", "H")
+# 国标建议四周留 4 个模块宽的空白 (静区)
+DEFAULT_BORDER = 4
+PAYLOAD_FILE_TYPES = ["csv", "txt"]
+# 内容清单依次尝试的编码：UTF-8 (可带 BOM)，不行再按 GB18030 (中文版 Excel 另存的 CSV 是 GBK，GB18030 兼容它)
+PAYLOAD_ENCODINGS = ("utf-8-sig", "gb18030")
+# 界面上说明的列名；清单第一行若全是这些列名，当作表头跳过
+PAYLOAD_HEADER_NAMES = ("文件名", "二维码内容", "左侧二维码内容", "右侧二维码内容")
+
+_UNSAFE_NAME_CHARS = re.compile(r'[\\/:*?"<>|\r\n\t]')
+
+
+class VectorQr:
+    # 与 pdf_engine.EncodedImage 接口相同 (width/height/pdf_dict/data...)，可以直接放进图片槽位
+    # 这里的 width/height 是含静区的模块数，合成时据此保持正方形并居中放进放置矩形
+    def __init__(self, size, data, digest=None):
+        self.width = size
+        self.height = size
+        self.filter_name = "/FlateDecode"
+        self.data = data
+        self.smask = None
+        self.decode_parms = None
+        self.digest = digest
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    def pdf_dict(self, smask_xref=0):
+        # 内容按模块坐标 (0..size) 绘制，/Matrix 缩放到单位正方形，和图片的坐标空间一致
+        # /Width、/Height 不是 Form 的标准键，阅读器会忽略，只供 PyMuPDF 计算放置比例
+        scale = f"{1 / self.width:.8f}"
+        return (f"<</Type/XObject/Subtype/Form/BBox[0 0 {self.width} {self.height}]"
+                f"/Matrix[{scale} 0 0 {scale} 0 0]/Width {self.width}/Height {self.height}>>")
+
+
+def qr_path_ops(matrix, border=DEFAULT_BORDER):
+    # matrix: 每行一个序列，真值为深色模块；返回绘制指令 (白底 + 黑色模块)
+    size = len(matrix) + 2 * border
+    ops = [f"1 g 0 0 {size} {size} re f 0 g"]
+    for r, row in enumerate(matrix):
+        # PDF 坐标原点在左下角，第 0 行在最上面
+        y = size - border - r - 1
+        c = 0
+        n = len(row)
+        while c < n:
+            if not row[c]:
+                c += 1
+                continue
+            start = c
+            while c < n and row[c]:
+                c += 1
+            # 同一行连续的深色模块合并成一个矩形，路径更短，也不会在相邻模块间露出细缝
+            ops.append(f"{start + border} {y} {c - start} 1 re")
+    ops.append("f")
+    return size, "\n".join(ops).encode("ascii")
+
+
+def encode_vector_qr(payload, error="M", border=DEFAULT_BORDER):
+    qr = segno.make_qr(payload, error=error)
+    size, ops = qr_path_ops(qr.matrix, border)
+    digest = f"qr:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}:{error}:{border}"
+    return VectorQr(size, zlib.compress(ops), digest)
+
+
+class VectorQrEncoder:
+    # 与 pdf_engine.ImagePreprocessor 用法相同：encode() 的输入是各位置的二维码内容文本
+    def __init__(self, rects, error="M", border=DEFAULT_BORDER):
+        self.slots = len(rects)
+        self.error = error
+        self.border = border
+
+    def encode(self, payloads):
+        if len(payloads) != self.slots:
+            raise ValueError(f"需要 {self.slots} 个二维码内容，实际提供了 {len(payloads)} 个")
+        return [encode_vector_qr(payload, self.error, self.border) for payload in payloads]
+
+
+# ===================================================================
+# 内容清单：CSV (逗号分隔) 或 TXT (制表符分隔)，每行一个输出
+# 列为 [文件名,] 内容1[, 内容2]：列数比二维码位置多一列时，第一列是输出文件名，否则按行号命名
+# ===================================================================
+def _safe_name(name):
+    return _UNSAFE_NAME_CHARS.sub("_", name.strip()) or "_"
+
+
+def _decode_text(data, filename):
+    for encoding in PAYLOAD_ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    raise ValueError(f"无法识别文件 '{filename}' 的编码，请另存为 UTF-8 或 GBK 编码后重试")
+
+
+def read_payload_rows(data, filename, slots):
+    # 依次产出 (输出文件名(不含扩展名), [各位置的二维码内容], 错误信息)
+    # 格式不对的行只产出错误信息 (内容为 None)，不中断整个清单
+    text = _decode_text(data, filename) if isinstance(data, bytes) else data
+    delimiter = "\t" if filename.lower().endswith(".txt") else ","
+    index = 0
+    first_row = True
+    for line_no, row in enumerate(csv.reader(io.StringIO(text), delimiter=delimiter), 1):
+        cells = [cell.strip() for cell in row]
+        if not any(cells) or cells[0].startswith("#"):
+            continue
+        if first_row:
+            first_row = False
+            if all(cell in PAYLOAD_HEADER_NAMES for cell in cells):
+                continue
+        if len(cells) == slots + 1:
+            name, payloads = _safe_name(cells[0]), cells[1:]
+        elif len(cells) == slots:
+            name, payloads = None, cells
+        else:
+            yield f"第{line_no}行", None, f"需要 {slots} 或 {slots + 1} 列，实际 {len(cells)} 列"
+            continue
+        index += 1
+        if not all(payloads):
+            yield name or f"第{line_no}行", None, "二维码内容为空"
+            continue
+        yield name or f"{index:05d}", payloads, None
@@ -0,0 +1,84 @@
+# zip_output.py
+# 输出后端：生成的PDF逐个写入磁盘上的临时文件，下载时再从磁盘读取，避免整个压缩包常驻内存
+import os
+import tempfile
+import time
+import zipfile
+
+# 生成的PDF本身已经压缩过，再用 ZIP_DEFLATED 压一遍几乎不会变小，只会多耗CPU
+ZIP_COMPRESSION_OPTIONS = {
+    "不压缩 (ZIP_STORED，更快)": zipfile.ZIP_STORED,
+    "压缩 (ZIP_DEFLATED)": zipfile.ZIP_DEFLATED,
+}
+
+# 临时ZIP统一放在这个目录下，方便运维定期清理
+SPOOL_DIR = os.path.join(tempfile.gettempdir(), "pdf_toolbox")
+# 超过这个时间 (秒) 没有修改的临时文件视为已无人下载 (会话已结束)，新建临时文件时顺带删除
+# 容器里的临时目录常常是 tmpfs，占的是内存，不能只靠同一会话下次生成时删除
+SPOOL_MAX_AGE = 6 * 3600
+
+
+def cleanup_spool(spool_dir=SPOOL_DIR, max_age=SPOOL_MAX_AGE):
+    # 删除过期的临时文件，返回删除的数量；正在写入的文件修改时间一直在更新，不会被误删
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        entries = list(os.scandir(spool_dir))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            # 可能刚好被其他会话删掉
+            continue
+    return removed
+
+
+def spool_path(suffix, spool_dir=SPOOL_DIR):
+    # 在临时目录下新建一个空文件并返回路径
+    os.makedirs(spool_dir, exist_ok=True)
+    cleanup_spool(spool_dir)
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="output_", dir=spool_dir)
+    os.close(fd)
+    return path
+
+
+class SpooledZip:
+    def __init__(self, compression=zipfile.ZIP_STORED, spool_dir=SPOOL_DIR, path=None):
+        # 指定 path 时直接写到该文件，否则在临时目录下新建
+        self.path = path or spool_path(".zip", spool_dir)
+        self._fp = open(self.path, "wb")
+        self._zip = zipfile.ZipFile(self._fp, "w", compression)
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # 出错时不留下写了一半的文件
+            self.discard()
+
+    def writestr(self, name, data):
+        self._zip.writestr(name, data)
+        self.count += 1
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._fp.close()
+            self._zip = None
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)